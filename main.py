@@ -1,31 +1,86 @@
 #!/usr/bin/env python3
+import atexit
 import csv
-import json
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import threading
 import time
 from dataclasses import dataclass, field
-from typing import Dict, List, Tuple
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+import numpy as np
+import orjson  # pip install orjson
 import requests  # pip install requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
 
 # ---------------- CONFIG ---------------- #
 
 SCENARIO_CSV_PATH = "scenarios.csv"
+SCENARIO_CACHE_VERSION = 4  # bump when Scenario/Outcome change shape
 LOG_CSV_PATH = "experiment_log.csv"
+LOG_FLUSH_EVERY = 5  # rows buffered before the log is flushed to disk
 
 OLLAMA_URL = "http://localhost:11434/api/chat"
+OLLAMA_GENERATE_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "qwen2.5:0.5b-instruct"  # change to your local model name
+OLLAMA_KEEP_ALIVE = "30m"  # keep the model (and its prompt cache) resident
+
+# At most this many past chat messages are sent to the model. The window
+# slides in steps of CHAT_HISTORY_STEP messages so the prompt prefix stays
+# unchanged (and KV-cached) between steps. Both should be even.
+CHAT_HISTORY_WINDOW = 12
+CHAT_HISTORY_STEP = 4
+
+# Exact-match reply cache, stored next to the experiment log.
+# Off by default; set LLM_CACHE_ENABLED=1 to turn it on (e.g. for replays or
+# test reruns). Trade-off: the cache is shared by every session and persists
+# across restarts, so participants who send an identical conversation get the
+# stored reply instead of a fresh model sample, and the log records it as an
+# ordinary "ai" turn.
+LLM_CACHE_PATH = "llm_cache.json"
+LLM_CACHE_MAX_ENTRIES = 2000  # oldest replies are evicted beyond this
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+
+# Semantic cache: reuse a reply when a paraphrased question is close enough
+# (cosine similarity) to one already answered in the same scenario/memory state.
+# Off by default; set SEMANTIC_CACHE_ENABLED=1 to turn it on. Trade-offs:
+# - every cache miss first makes a blocking /api/embeddings call (up to 30s)
+#   before the reply starts streaming, and loads the embedding model into
+#   Ollama next to the chat model;
+# - hits are shared across participants and ignore the chat history, yet are
+#   logged as ordinary "ai" turns.
+OLLAMA_EMBED_URL = "http://localhost:11434/api/embeddings"
+OLLAMA_EMBED_MODEL = "nomic-embed-text"
+SEMANTIC_CACHE_PATH = "semantic_cache.npz"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+
+# AI teammate instructions; {memo} is the scenario's technical memo
+BASE_SYSTEM_PROMPT = (
+    "You are an AI policy teammate in a research experiment.\n"
+    "You only see the following *technical memo* about this scenario "
+    "and NOT the human's stakeholder memo.\n\n"
+    "Technical memo:\n{memo}\n\n"
+    "Your role:\n"
+    "- Collaborate with the human.\n"
+    "- Offer reasoning and trade-offs between options A/B/C/D.\n"
+    "- Do NOT make the final decision; the human decides.\n"
+    "- Be honest that you only see technical data.\n"
+)
 
 # --------------- DATA MODELS --------------- #
 
-@dataclass
-class Outcome:
+class Outcome(NamedTuple):
     safety: int
     equity: int
     cost: int
     political: int
     total: int
 
-@dataclass
+@dataclass(slots=True)
 class Scenario:
     round_num: int
     scenario_id: str
@@ -34,6 +89,12 @@ class Scenario:
     human_private_info: str
     ai_private_info: str
     outcomes: Dict[str, Outcome]  # key: "A"/"B"/"C"/"D"
+    system_prompt: str = field(default="", repr=False)  # filled from BASE_SYSTEM_PROMPT
+
+    def __post_init__(self):
+        # Built once per scenario rather than on every chat turn
+        if not self.system_prompt:
+            self.system_prompt = BASE_SYSTEM_PROMPT.format(memo=self.ai_private_info)
 
 # Simple "team memory" for adaptation
 @dataclass
@@ -45,30 +106,66 @@ class TeamMemory:
 
 # --------------- CSV LOADING --------------- #
 
+# Cells are written in field order, so one match yields all five values
+_OUTCOME_RE = re.compile(
+    r"safety=(-?\d+),\s*equity=(-?\d+),\s*cost=(-?\d+),"
+    r"\s*political=(-?\d+),\s*total=(-?\d+)"
+)
+_OUTCOME_FIELD_RE = re.compile(r"(safety|equity|cost|political|total)\s*=\s*(-?\d+)")
+
+
 def parse_outcome_cell(cell: str) -> Outcome:
     """
     Parses strings like:
     "A: safety=2,equity=1,cost=2,political=1,total=6"
     into an Outcome object.
     """
-    # Remove "A:" prefix (or B:/C:/D:)
-    if ":" in cell:
-        cell = cell.split(":", 1)[1].strip()
-    parts = cell.split(",")
-    values = {}
-    for part in parts:
-        k, v = part.split("=")
-        values[k.strip()] = int(v.strip())
-    return Outcome(
-        safety=values["safety"],
-        equity=values["equity"],
-        cost=values["cost"],
-        political=values["political"],
-        total=values["total"],
-    )
+    match = _OUTCOME_RE.search(cell)
+    if match:
+        return Outcome._make(map(int, match.groups()))
+
+    # Fields out of order or spaced unusually: match them individually
+    values = dict(_OUTCOME_FIELD_RE.findall(cell))
+    try:
+        return Outcome._make(int(values[name]) for name in Outcome._fields)
+    except KeyError as e:
+        raise ValueError(f"Outcome cell {cell!r} is missing {e.args[0]!r}") from None
 
 
 def load_scenarios(path: str) -> List[Scenario]:
+    """
+    Returns the parsed scenarios, reusing a pickled sidecar
+    (scenarios.cache.pkl) while the CSV's mtime and size are unchanged.
+    """
+    stat = os.stat(path)
+    return _load_scenarios_cached(path, stat.st_mtime_ns, stat.st_size)
+
+
+@st.cache_data(show_spinner=False)
+def _load_scenarios_cached(path: str, mtime_ns: int, size: int) -> List[Scenario]:
+    # mtime_ns/size are part of the Streamlit cache key, so an edited CSV
+    # is re-read on the next rerun
+    key = (mtime_ns, size, SCENARIO_CACHE_VERSION, BASE_SYSTEM_PROMPT)
+    cache_path = os.path.splitext(path)[0] + ".cache.pkl"
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, scenarios = pickle.load(f)
+        if cached_key == key:
+            return scenarios
+    except Exception:
+        # Missing, stale or unreadable sidecar: fall back to the CSV
+        pass
+
+    scenarios = parse_scenarios_csv(path)
+    try:
+        with open(cache_path, "wb") as f:
+            pickle.dump((key, scenarios), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except (OSError, pickle.PicklingError):
+        pass
+    return scenarios
+
+
+def parse_scenarios_csv(path: str) -> List[Scenario]:
     scenarios: List[Scenario] = []
     with open(path, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -105,84 +202,392 @@ def load_scenarios(path: str) -> List[Scenario]:
 
 # --------------- OLLAMA / LLM --------------- #
 
-def generate_ai_reply(
-    scenario: Scenario,
-    team_memory: TeamMemory,
-    chat_history: List[Tuple[str, str]],  # list of (role, text) "participant"/"ai"
-    user_message: str,
-) -> str:
+# Streamlit re-executes this script on every rerun, so state that must
+# outlive a rerun (connections, in-memory caches) is held via st.cache_resource.
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+@st.cache_resource(show_spinner=False)
+def get_session() -> requests.Session:
+    """One keep-alive connection pool to Ollama, shared by every request."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    return session
+
+
+def _post_json(
+    url: str,
+    payload: dict,
+    session: Optional[requests.Session] = None,
+    **kwargs,
+) -> requests.Response:
+    # Serialize with orjson up front instead of requests' stdlib json path
+    session = session or get_session()
+    return session.post(url, data=orjson.dumps(payload), headers=_JSON_HEADERS, **kwargs)
+
+
+def _cache_key(messages: List[Dict[str, str]]) -> str:
+    """SHA-256 of the canonical JSON for the model + messages payload."""
+    canonical = orjson.dumps(
+        {"model": OLLAMA_MODEL, "messages": messages},
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(canonical).hexdigest()
+
+
+@st.cache_resource(show_spinner=False)
+def _cache_file_lock(path: str) -> threading.Lock:
+    """Serializes updates to a cache file across all sessions."""
+    return threading.Lock()
+
+
+def _atomic_write(path: str, write: Callable[[BinaryIO], None]):
     """
-    Calls a local Ollama model using /api/chat.
-    Make sure Ollama is running and the model is pulled.
+    Writes to a temp file in the same directory and renames it over path,
+    so readers never see a half-written file.
     """
-    system_prompt = (
-        "You are an AI policy teammate in a research experiment.\n"
-        "You only see the following *technical memo* about this scenario "
-        "and NOT the human's stakeholder memo.\n\n"
-        f"Technical memo:\n{scenario.ai_private_info}\n\n"
-        "Your role:\n"
-        "- Collaborate with the human.\n"
-        "- Offer reasoning and trade-offs between options A/B/C/D.\n"
-        "- Do NOT make the final decision; the human decides.\n"
-        "- Be honest that you only see technical data.\n"
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@st.cache_resource(show_spinner=False)
+def _load_reply_cache(path: str) -> Dict[str, str]:
+    try:
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+    except (OSError, ValueError):
+        # Missing, unreadable or corrupt cache file: start empty
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def _store_reply(key: str, ai_text: str, path: str = LLM_CACHE_PATH):
+    cache = _load_reply_cache(path)
+    with _cache_file_lock(path):
+        cache[key] = ai_text
+        # Dicts keep insertion order, so the first keys are the oldest
+        while len(cache) > LLM_CACHE_MAX_ENTRIES:
+            del cache[next(iter(cache))]
+        body = orjson.dumps(cache)
+        try:
+            _atomic_write(path, lambda f: f.write(body))
+        except OSError:
+            # Cache is best-effort; keep the in-memory copy
+            pass
+
+
+def _semantic_key(scenario: Scenario, team_memory: TeamMemory) -> str:
+    # Model names are part of the key so a model change never serves stale replies
+    return (
+        f"{OLLAMA_MODEL}|{OLLAMA_EMBED_MODEL}|{scenario.scenario_id}"
+        f"|{team_memory.explanation_length}|{int(team_memory.focus_equity)}"
     )
 
-    if team_memory.focus_equity:
-        system_prompt += (
-            "\nThe human has asked you to pay particular attention to equity "
+
+def _embed(text: str) -> Optional[np.ndarray]:
+    """Returns the unit-normalized embedding of text, or None if unavailable."""
+    payload = {"model": OLLAMA_EMBED_MODEL, "prompt": text}
+    try:
+        resp = _post_json(OLLAMA_EMBED_URL, payload, timeout=30)
+        resp.raise_for_status()
+        vec = np.asarray(resp.json().get("embedding", []), dtype=np.float32)
+    except Exception:
+        return None
+    norm = np.linalg.norm(vec)
+    if vec.size == 0 or norm == 0:
+        return None
+    return vec / norm
+
+
+@st.cache_resource(show_spinner=False)
+def _load_semantic_cache(path: str) -> Dict[str, Tuple[np.ndarray, List[str]]]:
+    """key -> (unit-normalized embeddings [n, d], replies [n])"""
+    cache: Dict[str, Tuple[np.ndarray, List[str]]] = {}
+    try:
+        with np.load(path) as data:
+            for name in data.files:
+                if name.endswith("::emb"):
+                    key = name[: -len("::emb")]
+                    cache[key] = (data[name], data[f"{key}::replies"].tolist())
+    except Exception:
+        # Missing, truncated (zipfile.BadZipFile) or otherwise corrupt
+        # cache file: start empty
+        cache.clear()
+    return cache
+
+
+def _semantic_lookup(key: str, query: np.ndarray, path: str = SEMANTIC_CACHE_PATH) -> Optional[str]:
+    entry = _load_semantic_cache(path).get(key)
+    if entry is None:
+        return None
+    embeddings, replies = entry
+    if embeddings.shape[1] != query.shape[0]:
+        # Embedding model changed since these entries were stored
+        return None
+    sims = embeddings @ query
+    best = int(np.argmax(sims))
+    if sims[best] >= SEMANTIC_CACHE_THRESHOLD:
+        return replies[best]
+    return None
+
+
+def _semantic_store(key: str, query: np.ndarray, ai_text: str, path: str = SEMANTIC_CACHE_PATH):
+    cache = _load_semantic_cache(path)
+    with _cache_file_lock(path):
+        if key in cache and cache[key][0].shape[1] == query.shape[0]:
+            embeddings, replies = cache[key]
+            cache[key] = (np.vstack([embeddings, query]), replies + [ai_text])
+        else:
+            cache[key] = (query[np.newaxis, :], [ai_text])
+
+        arrays = {}
+        for k, (embeddings, replies) in cache.items():
+            arrays[f"{k}::emb"] = embeddings
+            arrays[f"{k}::replies"] = np.array(replies, dtype=str)
+        try:
+            _atomic_write(path, lambda f: np.savez(f, **arrays))
+        except OSError:
+            # Cache is best-effort; keep the in-memory copy
+            pass
+
+
+def _format_memory_directives(explanation_length: str, focus_equity: bool) -> str:
+    directives = ""
+    if focus_equity:
+        directives += (
+            "The human has asked you to pay particular attention to equity "
             "and distributional impacts when relevant.\n"
         )
 
-    if team_memory.explanation_length == "short":
-        system_prompt += "\nKeep replies concise (2–3 sentences).\n"
-    elif team_memory.explanation_length == "long":
-        system_prompt += "\nGive more detailed reasoning (4–6 sentences).\n"
+    if explanation_length == "short":
+        directives += "Keep replies concise (2–3 sentences).\n"
+    elif explanation_length == "long":
+        directives += "Give more detailed reasoning (4–6 sentences).\n"
     else:
-        system_prompt += "\nUse a moderate level of detail (3–4 sentences).\n"
+        directives += "Use a moderate level of detail (3–4 sentences).\n"
+    return directives
 
-    # Build message history for Ollama
-    messages = [{"role": "system", "content": system_prompt}]
 
-    for role, text in chat_history:
-        if role == "participant":
-            messages.append({"role": "user", "content": text})
-        else:
-            messages.append({"role": "assistant", "content": text})
+# Every (explanation_length, focus_equity) combination, formatted once
+_MEMORY_DIRECTIVES: Dict[Tuple[str, bool], str] = {
+    (length, equity): _format_memory_directives(length, equity)
+    for length in ("short", "medium", "long")
+    for equity in (False, True)
+}
+
+
+def memory_directives(team_memory: TeamMemory) -> str:
+    key = (team_memory.explanation_length, team_memory.focus_equity)
+    directives = _MEMORY_DIRECTIVES.get(key)
+    if directives is None:
+        directives = _format_memory_directives(*key)
+    return directives
+
+
+def _warm_model(session: requests.Session):
+    # An empty prompt makes Ollama load the model without generating anything
+    payload = {"model": OLLAMA_MODEL, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE}
+    try:
+        _post_json(OLLAMA_GENERATE_URL, payload, session=session, timeout=120).raise_for_status()
+    except Exception:
+        # Warmup is only an optimization; the first real turn will load the model
+        pass
+
 
-    # Add the latest user message
-    messages.append({"role": "user", "content": user_message})
+def warm_model():
+    """Loads the model into Ollama in the background."""
+    threading.Thread(target=_warm_model, args=(get_session(),), daemon=True).start()
 
+
+def _warm_prompt_prefix(scenario: Scenario, session: requests.Session):
     payload = {
         "model": OLLAMA_MODEL,
-        "messages": messages,
+        "messages": [
+            {"role": "system", "content": scenario.system_prompt},
+            {"role": "user", "content": ""},
+        ],
         "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_predict": 1},
+    }
+    try:
+        _post_json(OLLAMA_URL, payload, session=session, timeout=60).raise_for_status()
+    except Exception:
+        # Warmup is only an optimization; the first real turn will prefill
+        pass
+
+
+def warm_prompt_prefix(scenario: Scenario):
+    """
+    Loads the model and prefills the scenario's system prompt in the
+    background so the first chat turn only has to encode the user message.
+    Called once per round per session; if Ollama already holds the prefix
+    this is close to free.
+    """
+    # Resolve the session here; the worker thread has no Streamlit context
+    threading.Thread(
+        target=_warm_prompt_prefix,
+        args=(scenario, get_session()),
+        daemon=True,
+    ).start()
+
+
+_ACK_REPLY = "Got it. Let me know if you'd like to go through the trade-offs between options A/B/C/D."
+_GREETING_REPLY = (
+    "Hi! I've read the technical memo for this scenario. "
+    "Ask me about any of the options A/B/C/D."
+)
+_THANKS_REPLY = "You're welcome! I'm here if you want to compare the options further."
+_CLARIFY_REPLY = "Could you say a bit more about what you'd like to discuss?"
+
+# Short acknowledgements and greetings answered without calling the model
+_DIRECT_REPLIES = {
+    "ok": _ACK_REPLY,
+    "okay": _ACK_REPLY,
+    "got it": _ACK_REPLY,
+    "hi": _GREETING_REPLY,
+    "hello": _GREETING_REPLY,
+    "thanks": _THANKS_REPLY,
+    "thank you": _THANKS_REPLY,
+}
+
+
+def direct_reply(user_message: str) -> Optional[str]:
+    """Returns a canned reply for trivial messages, or None if the model is needed."""
+    if not any(ch.isalnum() for ch in user_message):
+        return _CLARIFY_REPLY
+    if len(user_message.split()) > 2:
+        return None
+    return _DIRECT_REPLIES.get(user_message.strip().lower().rstrip("!.?,"))
+
+
+def windowed_history(chat_history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Drops the oldest messages, CHAT_HISTORY_STEP at a time, to stay within CHAT_HISTORY_WINDOW."""
+    overflow = len(chat_history) - CHAT_HISTORY_WINDOW
+    if overflow <= 0:
+        return chat_history
+    start = -(-overflow // CHAT_HISTORY_STEP) * CHAT_HISTORY_STEP  # round up to a whole step
+    return chat_history[start:]
+
+
+def stream_ai_reply(
+    scenario: Scenario,
+    team_memory: TeamMemory,
+    chat_history: List[Dict[str, str]],  # Ollama-format {"role": "user"/"assistant", "content": text}
+    user_message: str,
+) -> Iterator[str]:
+    """
+    Calls a local Ollama model using /api/chat with streaming enabled and
+    yields the reply text as it is generated.
+    Make sure Ollama is running and the model is pulled.
+    """
+    canned = direct_reply(user_message)
+    if canned is not None:
+        yield canned
+        return
+
+    # Callers may have already appended the new message to the history;
+    # don't send it to the model twice
+    if chat_history and chat_history[-1] == {"role": "user", "content": user_message}:
+        chat_history = chat_history[:-1]
+
+    # The system message only depends on the scenario, so it (and every
+    # earlier turn) stays a byte-identical prefix that Ollama can reuse from
+    # its KV cache. Team-memory directives go after the history instead.
+    # History is already stored in Ollama's message format
+    messages = [
+        {"role": "system", "content": scenario.system_prompt},
+        *windowed_history(chat_history),
+        {"role": "system", "content": memory_directives(team_memory)},
+        {"role": "user", "content": user_message},
+    ]
+
+    if LLM_CACHE_ENABLED:
+        cache_key = _cache_key(messages)
+        cached = _load_reply_cache(LLM_CACHE_PATH).get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    query_vec = None
+    if SEMANTIC_CACHE_ENABLED:
+        semantic_key = _semantic_key(scenario, team_memory)
+        query_vec = _embed(user_message)
+        if query_vec is not None:
+            cached = _semantic_lookup(semantic_key, query_vec)
+            if cached is not None:
+                yield cached
+                return
+
+    payload = {
+        "model": OLLAMA_MODEL,
+        "messages": messages,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
     }
 
+    parts: List[str] = []
     try:
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-        # Ollama /api/chat style
-        ai_text = data.get("message", {}).get("content", "").strip()
-        if not ai_text:
-            ai_text = "[AI did not return any content.]"
-        return ai_text
+        with _post_json(OLLAMA_URL, payload, stream=True, timeout=60) as resp:
+            resp.raise_for_status()
+            # Ollama /api/chat streams one JSON object per line
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                delta = chunk.get("message", {}).get("content", "")
+                if not parts:
+                    delta = delta.lstrip()
+                if delta:
+                    parts.append(delta)
+                    yield delta
+                if chunk.get("done"):
+                    break
     except Exception as e:
-        return f"[Error contacting AI teammate: {e}]"
+        yield f"[Error contacting AI teammate: {e}]"
+        return
+
+    ai_text = "".join(parts).strip()
+    if not ai_text:
+        yield "[AI did not return any content.]"
+        return
+    if LLM_CACHE_ENABLED:
+        _store_reply(cache_key, ai_text)
+    if query_vec is not None:
+        _semantic_store(semantic_key, query_vec, ai_text)
 
 
 # --------------- TEAM MEMORY UPDATE --------------- #
 
+# Substring matches, same as the original `in` checks ("shorter" counts as short)
+_SHORT_RE = re.compile(r"short|concise|brief", re.IGNORECASE)
+_LONG_RE = re.compile(r"more detail|longer|explain more", re.IGNORECASE)
+_EQUITY_RE = re.compile(r"equity|fairness|fair", re.IGNORECASE)
+
+
 def update_team_memory(memory: TeamMemory, instruction: str) -> TeamMemory:
-    text = instruction.lower()
     memory.user_instructions.append(instruction)
 
-    if "short" in text or "concise" in text or "brief" in text:
+    if _SHORT_RE.search(instruction):
         memory.explanation_length = "short"
-    elif "more detail" in text or "longer" in text or "explain more" in text:
+    elif _LONG_RE.search(instruction):
         memory.explanation_length = "long"
 
-    if "equity" in text or "fairness" in text or "fair" in text:
+    if _EQUITY_RE.search(instruction):
         memory.focus_equity = True
 
     return memory
@@ -190,30 +595,108 @@ def update_team_memory(memory: TeamMemory, instruction: str) -> TeamMemory:
 
 # --------------- LOGGING --------------- #
 
+LOG_HEADER = [
+    "timestamp",
+    "participant_id",
+    "round_num",
+    "scenario_id",
+    "choice",
+    "safety",
+    "equity",
+    "cost",
+    "political",
+    "total",
+    "chat_history_json",
+    "instruction_text",
+]
+
+
 def init_log(path: str):
     try:
         # If file does not exist, create with header
         with open(path, "x", encoding="utf-8", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow(
-                [
-                    "timestamp",
-                    "participant_id",
-                    "round_num",
-                    "scenario_id",
-                    "choice",
-                    "safety",
-                    "equity",
-                    "cost",
-                    "political",
-                    "total",
-                    "chat_history_json",
-                    "instruction_text",
-                ]
-            )
+            writer.writerow(LOG_HEADER)
     except FileExistsError:
         # Already exists, do nothing
         pass
+    get_log_writer(path)
+
+
+class _LogWriter:
+    """
+    Keeps the log CSV open for the whole session and collects rows in
+    memory, writing them in one writerows() call every `flush_every` rows,
+    on flush(), and at exit. If the log is moved aside or deleted while
+    open, the next flush reopens `path` (with a header if it is new).
+    """
+
+    def __init__(self, path: str, flush_every: int = LOG_FLUSH_EVERY):
+        self._path = path
+        self._flush_every = flush_every
+        self._buf: List[list] = []
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        self._fp = open(self._path, "a", encoding="utf-8", newline="", buffering=64 * 1024)
+        self._writer = csv.writer(self._fp)
+        if self._fp.tell() == 0:
+            self._writer.writerow(LOG_HEADER)
+
+    def write_row(self, row: list):
+        with self._lock:
+            self._buf.append(row)
+            if len(self._buf) >= self._flush_every:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            if not self._fp.closed:
+                self._flush_locked()
+                self._fp.close()
+
+    def _reopen_if_moved_locked(self):
+        try:
+            current = os.stat(self._path)
+        except FileNotFoundError:
+            current = None
+        opened = os.fstat(self._fp.fileno())
+        if current is None or (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+            # Everything written so far has been flushed, so the old
+            # handle holds no pending data
+            self._fp.close()
+            self._open()
+
+    def _flush_locked(self):
+        if self._fp.closed:
+            return
+        if self._buf:
+            self._reopen_if_moved_locked()
+            self._writer.writerows(self._buf)
+            self._buf.clear()
+        self._fp.flush()
+
+
+@st.cache_resource(show_spinner=False)
+def get_log_writer(path: str = LOG_CSV_PATH) -> _LogWriter:
+    # Cached as a resource so the open file survives Streamlit reruns
+    writer = _LogWriter(path)
+    atexit.register(writer.close)
+    return writer
+
+
+# Chat history roles as written to the log ("participant"/"ai")
+_LOG_ROLES = {"user": "participant", "assistant": "ai"}
+
+
+def log_chunk(msg: Dict[str, str]) -> str:
+    """Serializes one chat message as its entry in the chat_history_json column."""
+    return orjson.dumps([_LOG_ROLES[msg["role"]], msg["content"]]).decode("utf-8")
 
 
 def log_round(
@@ -221,27 +704,26 @@ def log_round(
     scenario: Scenario,
     choice: str,
     outcome: Outcome,
-    chat_history: List[Tuple[str, str]],
+    chat_history: List[Dict[str, str]],
     instruction_text: str,
     log_path: str = LOG_CSV_PATH,
+    chat_history_chunks: Optional[List[str]] = None,
 ):
+    # Messages are normally serialized one at a time as they arrive
+    # (see log_chunk); fall back to serializing the whole history here
+    if chat_history_chunks is None:
+        chat_history_chunks = [log_chunk(msg) for msg in chat_history]
     row = [
         time.strftime("%Y-%m-%d %H:%M:%S"),
         participant_id,
         scenario.round_num,
         scenario.scenario_id,
         choice,
-        outcome.safety,
-        outcome.equity,
-        outcome.cost,
-        outcome.political,
-        outcome.total,
-        json.dumps(chat_history, ensure_ascii=False),
+        *outcome,  # safety, equity, cost, political, total
+        "[" + ",".join(chat_history_chunks) + "]",
         instruction_text,
     ]
-    with open(log_path, "a", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(row)
+    get_log_writer(log_path).write_row(row)
 
 
 # --------------- STREAMLIT UI --------------- #
@@ -259,7 +741,9 @@ def init_session_state():
     if "total_score" not in st.session_state:
         st.session_state.total_score = 0
     if "chat_histories" not in st.session_state:
-        st.session_state.chat_histories = {}  # round_num -> List[Tuple[str, str]]
+        st.session_state.chat_histories = {}  # round_num -> List[Dict[str, str]] (Ollama messages)
+    if "chat_history_json" not in st.session_state:
+        st.session_state.chat_history_json = {}  # round_num -> List[str] (log_chunk per message)
     if "decisions" not in st.session_state:
         st.session_state.decisions = {}  # round_num -> choice
     if "instructions" not in st.session_state:
@@ -270,6 +754,8 @@ def init_session_state():
         st.session_state.experiment_started = False
     if "experiment_complete" not in st.session_state:
         st.session_state.experiment_complete = False
+    if "warmup_started" not in st.session_state:
+        st.session_state.warmup_started = False
 
 
 def render_welcome_page():
@@ -285,6 +771,17 @@ def render_welcome_page():
     - You can chat with the AI, then choose a policy option A/B/C/D.
     """)
     
+    # Use the time spent on this page to load the model and parse scenarios,
+    # so the first round does not pay the cold-start cost
+    if not st.session_state.warmup_started:
+        st.session_state.warmup_started = True
+        warm_model()
+        try:
+            load_scenarios(SCENARIO_CSV_PATH)
+        except Exception:
+            # Reported when the experiment is started
+            pass
+    
     participant_id = st.text_input(
         "Enter participant ID (or your name/alias):",
         value="",
@@ -315,87 +812,79 @@ def render_chat_interface(scenario: Scenario):
     # Initialize chat history for this round
     if scenario.round_num not in st.session_state.chat_histories:
         st.session_state.chat_histories[scenario.round_num] = []
+        st.session_state.chat_history_json[scenario.round_num] = []
+        warm_prompt_prefix(scenario)
     
     chat_history = st.session_state.chat_histories[scenario.round_num]
+    chat_history_json = st.session_state.chat_history_json[scenario.round_num]
     
     st.subheader("💬 Chat with AI Teammate")
     
     # Display chat messages
     chat_container = st.container()
     with chat_container:
-        for role, message in chat_history:
-            if role == "participant":
-                with st.chat_message("user"):
-                    st.write(message)
-            else:
-                with st.chat_message("assistant"):
-                    st.write(message)
+        for msg in chat_history:
+            with st.chat_message(msg["role"]):
+                st.write(msg["content"])
     
     # Chat input
     user_message = st.chat_input("Type your message here...")
     
     if user_message:
         # Add user message to history
-        chat_history.append(("participant", user_message))
+        user_msg = {"role": "user", "content": user_message}
+        chat_history.append(user_msg)
+        chat_history_json.append(log_chunk(user_msg))
         st.session_state.chat_histories[scenario.round_num] = chat_history
         
-        # Generate AI reply
-        with st.spinner("AI is thinking..."):
-            ai_reply = generate_ai_reply(
-                scenario,
-                st.session_state.team_memory,
-                chat_history[:-1],  # Exclude the just-added user message
-                user_message
-            )
-            chat_history.append(("ai", ai_reply))
-            st.session_state.chat_histories[scenario.round_num] = chat_history
-        
-        st.rerun()
+        # Stream the AI reply into the chat; both new messages are rendered
+        # here directly, so no extra rerun is needed to display them
+        with chat_container:
+            with st.chat_message("user"):
+                st.write(user_message)
+            with st.chat_message("assistant"):
+                ai_reply = st.write_stream(
+                    stream_ai_reply(
+                        scenario,
+                        st.session_state.team_memory,
+                        chat_history[:-1],  # Exclude the just-added user message
+                        user_message
+                    )
+                )
+        ai_msg = {"role": "assistant", "content": ai_reply.strip()}
+        chat_history.append(ai_msg)
+        chat_history_json.append(log_chunk(ai_msg))
+        st.session_state.chat_histories[scenario.round_num] = chat_history
 
 
 def render_decision_interface(scenario: Scenario):
     """Render the decision interface"""
     st.subheader("📋 Make Your Decision")
     
-    # Parse options text to show buttons
+    # Options text shown under the form
     options_text = scenario.options_text
     
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        if st.button("Option A", key=f"option_A_{scenario.round_num}", use_container_width=True):
-            # Only update if decision hasn't been made yet
-            if scenario.round_num not in st.session_state.decisions:
-                st.session_state.decisions[scenario.round_num] = "A"
-                # Update total score
-                outcome = scenario.outcomes["A"]
-                st.session_state.total_score += outcome.total
-            st.rerun()
-        if st.button("Option C", key=f"option_C_{scenario.round_num}", use_container_width=True):
-            # Only update if decision hasn't been made yet
-            if scenario.round_num not in st.session_state.decisions:
-                st.session_state.decisions[scenario.round_num] = "C"
-                # Update total score
-                outcome = scenario.outcomes["C"]
-                st.session_state.total_score += outcome.total
-            st.rerun()
-    
-    with col2:
-        if st.button("Option B", key=f"option_B_{scenario.round_num}", use_container_width=True):
-            # Only update if decision hasn't been made yet
-            if scenario.round_num not in st.session_state.decisions:
-                st.session_state.decisions[scenario.round_num] = "B"
-                # Update total score
-                outcome = scenario.outcomes["B"]
-                st.session_state.total_score += outcome.total
-            st.rerun()
-        if st.button("Option D", key=f"option_D_{scenario.round_num}", use_container_width=True):
-            # Only update if decision hasn't been made yet
-            if scenario.round_num not in st.session_state.decisions:
-                st.session_state.decisions[scenario.round_num] = "D"
-                # Update total score
-                outcome = scenario.outcomes["D"]
-                st.session_state.total_score += outcome.total
+    # A form batches the selection and confirmation into a single rerun.
+    # No option is preselected so the participant has to pick one.
+    with st.form(key=f"decision_{scenario.round_num}"):
+        choice = st.radio(
+            "Choose an option",
+            list(scenario.outcomes),  # "A"/"B"/"C"/"D"
+            index=None,
+            horizontal=True,
+            format_func=lambda opt: f"Option {opt}",
+            key=f"radio_{scenario.round_num}",
+        )
+        submitted = st.form_submit_button("Confirm Decision", type="primary", use_container_width=True)
+
+    if submitted:
+        if choice is None:
+            st.warning("Please choose an option before confirming.")
+        # Only update if decision hasn't been made yet
+        elif scenario.round_num not in st.session_state.decisions:
+            st.session_state.decisions[scenario.round_num] = choice
+            # Update total score
+            st.session_state.total_score += scenario.outcomes[choice].total
             st.rerun()
     
     # Show options text
@@ -408,16 +897,10 @@ def render_outcome_display(scenario: Scenario, choice: str):
     
     st.subheader("📊 Round Outcome")
     
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.metric("Safety", outcome.safety)
-    with col2:
-        st.metric("Equity", outcome.equity)
-    with col3:
-        st.metric("Cost", outcome.cost)
-    with col4:
-        st.metric("Political", outcome.political)
+    # One column per score component (Outcome fields, minus the total)
+    components = Outcome._fields[:-1]
+    for col, name, value in zip(st.columns(len(components)), components, outcome):
+        col.metric(name.capitalize(), value)
     
     st.metric("Round Total", outcome.total)
     st.metric("Cumulative Total", st.session_state.total_score)
@@ -447,6 +930,7 @@ def render_outcome_display(scenario: Scenario, choice: str):
             choice=choice,
             outcome=outcome,
             chat_history=st.session_state.chat_histories.get(scenario.round_num, []),
+            chat_history_chunks=st.session_state.chat_history_json.get(scenario.round_num, []),
             instruction_text=st.session_state.instructions.get(scenario.round_num, ""),
         )
         
@@ -497,6 +981,8 @@ def render_completion_page():
     st.balloons()
     
     st.metric("Final Total Score", st.session_state.total_score)
+
+    get_log_writer(LOG_CSV_PATH).flush()
     
     st.success(f"Data saved to: {LOG_CSV_PATH}")
     